@@ -6,8 +6,11 @@ class CustomConfig(AppConfig):
     verbose_name = "Settings"
 
     def ready(self, *args, **kwargs):
-        # run settings initializer
         from .models import Settings
 
+        # resolve reboot files once, rather than on every save
+        Settings.get_touch_files()
+
+        # run settings initializer
         Settings.init()
         Settings.check_secret_key()
@@ -1,8 +1,13 @@
+import functools
 import importlib
+import importlib.util
+import inspect
 import logging
 import os
-from pathlib import Path
+import stat
 import sys
+import tempfile
+import warnings
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied, ValidationError
@@ -15,13 +20,27 @@ from .settings import get_setting
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def _settings_file_path(filename):
+    """
+    Resolve the path for ``filename`` in the directory of the active settings module.
+    The settings module doesn't change at runtime, so the result is cached.
+    """
+    module_name = os.environ["DJANGO_SETTINGS_MODULE"]
+    try:
+        settings_module = sys.modules[module_name]
+    except KeyError:
+        settings_module = importlib.import_module(module_name)
+    return os.path.join(os.path.dirname(settings_module.__file__), filename)
+
+
 class SettingsQuerySet(models.query.QuerySet):
     """
     Prevent deletion of active settings.
     """
 
     def delete(self, *args, **kwargs):
-        if self.filter(is_active=True) and not self.model.ALLOW_NO_SETTINGS:
+        if self.filter(is_active=True).exists() and not self.model.ALLOW_NO_SETTINGS:
             raise PermissionDenied("Cannot delete settings which are currently active.")
         return super().delete(*args, **kwargs)
 
@@ -34,7 +53,7 @@ class SettingsModel(models.Model):
     """
 
     name = models.CharField(default="Default", max_length=255, unique=True, blank=False)
-    is_active = models.BooleanField(default=True)
+    is_active = models.BooleanField(default=True, db_index=True)
 
     objects = SettingsQuerySet.as_manager()
 
@@ -43,6 +62,9 @@ class SettingsModel(models.Model):
     WRITABLE_INDEX = 3
     ALLOW_NO_SETTINGS = False
 
+    # files touched to signal a reboot, resolved by `get_touch_files`
+    _touch_files = None
+
     class Meta:
         abstract = True
 
@@ -75,13 +97,48 @@ class SettingsModel(models.Model):
         """
         raise NotImplementedError
 
-    def encode_setting(self, field):
+    def encode_setting(self, field, value):
         """
-        Given a field, convert the field to a string representing the Python code that
-        should be written to the settings file.
+        Given a field name and its value, convert the value to a string representing the
+        Python code that should be written to the settings file.
+
+        Implementations taking only the value (``encode_setting(self, value)``) are
+        deprecated, but still supported.
         """
         raise NotImplementedError
 
+    def _encode_setting(self, field, value):
+        """
+        Call `encode_setting`, supporting the deprecated single-argument signature.
+        """
+        cls = type(self)
+        if "_legacy_encode_setting" not in cls.__dict__:
+            params = list(inspect.signature(self.encode_setting).parameters.values())
+            cls._legacy_encode_setting = (
+                len(params) == 1 and params[0].kind != params[0].VAR_POSITIONAL
+            )
+            if cls._legacy_encode_setting:
+                warnings.warn(
+                    "{}.encode_setting(value) is deprecated; implement "
+                    "encode_setting(field, value) instead.".format(cls.__name__),
+                    DeprecationWarning,
+                    stacklevel=2,
+                )
+        if cls._legacy_encode_setting:
+            return self.encode_setting(value)
+        return self.encode_setting(field, value)
+
+    @classmethod
+    def _filter_settings_map(cls, index):
+        """
+        Get the entries of ``__settings_map__`` which have a truthy flag at ``index``.
+        The map is a class constant, so the result is computed once per class.
+        """
+        key = "_settings_map_{}".format(index)
+        if key not in cls.__dict__:
+            setattr(cls, key, tuple(x for x in cls.__settings_map__ if x[index]))
+        return cls.__dict__[key]
+
     def _get_settings_file(self):
         """
         The settings file should be saved next to the settings that are active. We will
@@ -91,10 +148,7 @@ class SettingsModel(models.Model):
         The user may be using multiple settings models, so each one should define a
         unique ``__settings_filename__`` and we will write to that file name.
         """
-        settings_file = importlib.import_module(
-            os.environ["DJANGO_SETTINGS_MODULE"]
-        ).__file__
-        return os.path.join(os.path.dirname(settings_file), self.__settings_filename__)
+        return _settings_file_path(self.__settings_filename__)
 
     @classmethod
     def init(cls):
@@ -115,14 +169,13 @@ class SettingsModel(models.Model):
             s = cls.objects.filter(is_active=True).first()
             if s:
                 s.read_settings()
-                if cls.objects.filter(is_active=True).exclude(pk=s.pk):
+                if cls.objects.filter(is_active=True).exclude(pk=s.pk).exists():
                     # need to invalidate other settings and ensure the settings file
                     # maps to this instance, so call the save() method.
                     s.save()
             elif not cls.ALLOW_NO_SETTINGS:
-                s = cls.objects.all()
+                s = cls.objects.order_by("pk").first()
                 if s:
-                    s = s.first()
                     s.is_active = True
                     s.save()
                 else:
@@ -135,29 +188,81 @@ class SettingsModel(models.Model):
 
     def read_settings(self):
         """
-        Read settings from Django into this instance.
+        Read settings from Django into this instance, saving only if something changed.
         """
-        for s in [x for x in self.__settings_map__ if x[self.READABLE_INDEX]]:
+        dirty = False
+        for field, name, *_ in self._filter_settings_map(self.READABLE_INDEX):
             try:
-                setattr(self, s[0], getattr(settings, s[1]))
+                value = getattr(settings, name)
             except AttributeError:  # setting not found
-                pass
-        return self.save(reboot=False)
+                continue
+            # compare in the form stored in the db, since settings (e.g., lists) may be
+            # stored differently than they are represented in Django
+            model_field = self._meta.get_field(field)
+            try:
+                new = model_field.get_prep_value(model_field.to_python(value))
+                changed = model_field.get_prep_value(getattr(self, field)) != new
+            except ValidationError:
+                changed = True
+            if changed:
+                setattr(self, field, value)
+                dirty = True
+        if dirty or self.pk is None:
+            self.save(reboot=False)
 
     def write_settings(self):
         """
-        Write the settings defined by this instance to the settings file.
+        Write the settings defined by this instance to the settings file. Returns
+        `False` if the file already has this content, in which case nothing is written.
         """
-        text = '"""WARNING: Autogenerated by django-settings-model."""\n\n'
-        for s in [x for x in self.__settings_map__ if x[self.WRITABLE_INDEX]]:
-            content = self.encode_setting(getattr(self, s[0]))
+        parts = ['"""WARNING: Autogenerated by django-settings-model."""\n\n']
+        for field, name, *_ in self._filter_settings_map(self.WRITABLE_INDEX):
+            content = self._encode_setting(field, getattr(self, field))
             if content:
-                text += "{} = {}\n".format(s[1], content)
+                parts.append("{} = {}\n".format(name, content))
+        text = "".join(parts)
 
-        # write to settings file
-        with open(self._get_settings_file(), "w") as f:
-            logger.info("writing config to {}".format(f.name))
-            f.write(text)
+        # skip the write (and the reboot it triggers) if nothing changed
+        path = self._get_settings_file()
+        try:
+            with open(path) as f:
+                if f.read() == text:
+                    logger.info("config at {} is unchanged".format(path))
+                    return False
+        except FileNotFoundError:
+            pass
+
+        # write to a unique temporary file and move it into place, so a crash or a
+        # concurrent writer never leaves a truncated settings file behind
+        logger.info("writing config to {}".format(path))
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            prefix=".{}.".format(os.path.basename(path)),
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w", buffering=65536) as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)  # mkstemp creates the file as owner-only
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        # persist the rename, where the platform supports syncing directories
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(os.path.dirname(path), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return True
 
     def delete_settings(self):
         """
@@ -170,15 +275,16 @@ class SettingsModel(models.Model):
         Raise validation error if our `is_active` is False but there are no other
         active settings.
         """
+        if self.is_active or self.ALLOW_NO_SETTINGS:
+            return
         if self.pk:
             q = models.Q(pk=self.pk)
         else:
             q = models.Q()
         other_actives = type(self).objects.filter(is_active=True).exclude(q)
-        if not (self.is_active or other_actives or self.ALLOW_NO_SETTINGS):
+        if not other_actives.exists():
             raise ValidationError("No other active settings, so these must be active.")
 
-    @transaction.atomic
     def save(self, *args, **kwargs):
         """
         Save this instance, check to ensure only one instance is active, and reboot, if
@@ -187,6 +293,20 @@ class SettingsModel(models.Model):
         # extract custom kwargs
         reboot = kwargs.pop("reboot", True)
 
+        result = self._save(*args, **kwargs)
+
+        # schedule outside of the savepoint `_save` creates, so that multiple saves in
+        # the same transaction can share a single callback
+        if self.is_active and reboot:
+            self._schedule_write_and_signal_reboot()
+
+        return result
+
+    @transaction.atomic
+    def _save(self, *args, **kwargs):
+        """
+        Save this instance, ensuring that only one instance is active.
+        """
         # deactivate extra settings if needed; ensure settings rules are followed
         actives = type(self).objects.filter(is_active=True).exclude(pk=self.pk)
         if self.is_active:  # if we are active, disable all others
@@ -202,9 +322,6 @@ class SettingsModel(models.Model):
                 else:
                     self.is_active = True
 
-        if self.is_active and reboot:
-            transaction.on_commit(lambda: self.write_and_signal_reboot())
-
         return super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -212,45 +329,93 @@ class SettingsModel(models.Model):
             raise PermissionDenied("Cannot delete settings which are currently active.")
         return super().delete(*args, **kwargs)
 
-    @staticmethod
-    def signal_reboot():
+    @classmethod
+    def get_touch_files(cls):
         """
-        Find and touch the reboot files to signal the server to restart.
+        Get the files which should be touched to signal the server to restart. These are
+        resolved once and cached on `SettingsModel` (they are shared by all settings
+        models), since the settings they depend on don't change at runtime.
         """
-        # get reboot files
-        touch_files = get_setting("SETTINGS_MODEL_REBOOT_FILES")
-        if not touch_files:
-            touch_files = [
-                os.path.join(get_setting("BASE_DIR"), "manage.py")
-            ]  # dev server
-            try:
-                wsgi_module = get_setting("WSGI_APPLICATION").rsplit(".", 1)[0]
+        if SettingsModel._touch_files is None:
+            touch_files = list(get_setting("SETTINGS_MODEL_REBOOT_FILES") or [])
+            if not touch_files:
+                touch_files = [
+                    os.path.join(get_setting("BASE_DIR"), "manage.py")
+                ]  # dev server
                 try:
-                    importlib.import_module(wsgi_module)
-                except RuntimeError:
+                    # locate the wsgi module without importing it, since importing it
+                    # during app loading would re-enter `django.setup()`
+                    wsgi_module = get_setting("WSGI_APPLICATION").rsplit(".", 1)[0]
+                    spec = importlib.util.find_spec(wsgi_module)
+                    if spec and spec.origin:
+                        touch_files.append(spec.origin)
+                except (AttributeError, IndexError, ImportError, ValueError):
                     pass
-                touch_files.append(sys.modules[wsgi_module].__file__)
-            except (AttributeError, IndexError, KeyError, ImportError):
-                pass
+            SettingsModel._touch_files = tuple(touch_files)
+        return SettingsModel._touch_files
+
+    @classmethod
+    def signal_reboot(cls):
+        """
+        Find and touch the reboot files to signal the server to restart.
+        """
+        touch_files = cls.get_touch_files()
 
         # touch files to signal reboot
         logger.info("signalling webserver reboot")
         logger.debug("  touching:")
         for f in touch_files:
-            p = Path(f)
-            if p.exists():
+            try:
+                os.utime(f, None)
                 logger.debug("   - {}".format(f))
-                p.touch()
-            else:
+            except FileNotFoundError:
                 logger.debug("   - {} (skipped, doesn't exist)".format(f))
 
+    def _schedule_write_and_signal_reboot(self):
+        """
+        Schedule `write_and_signal_reboot` to run when the transaction commits. Only one
+        callback is registered per model and savepoint level, so multiple saves result
+        in a single write of the most recently saved instance.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self.write_and_signal_reboot()
+            return
+
+        pending = getattr(connection, "_settings_model_pending", None)
+        if pending is None:
+            pending = connection._settings_model_pending = {}
+        key = type(self)
+
+        # Django replaces its list of commit hooks on every commit, rollback, and
+        # savepoint rollback, so if the list and savepoints are unchanged, the pending
+        # callback is still registered at this level and can just be pointed at us.
+        hooks = connection.run_on_commit
+        savepoint_ids = tuple(connection.savepoint_ids)
+        entry = pending.get(key)
+        if entry and entry["hooks"] is hooks and entry["savepoints"] == savepoint_ids:
+            entry["instance"] = self
+            return
+
+        entry = {"instance": self, "hooks": hooks, "savepoints": savepoint_ids}
+
+        def callback():
+            if pending.get(key) is entry:
+                del pending[key]
+            entry["instance"].write_and_signal_reboot()
+
+        pending[key] = entry
+        transaction.on_commit(callback)
+
     def write_and_signal_reboot(self, commit=True):
         """
-        Commit the configuration to disk and call `signal_reboot`.
+        Commit the configuration to disk and call `signal_reboot`, unless the
+        configuration on disk was already up to date.
         """
         if commit:
             logger.info("committing config to disk...")
-            self.write_settings()
+            if not self.write_settings():
+                return
 
         # signal reboot
         self.signal_reboot()
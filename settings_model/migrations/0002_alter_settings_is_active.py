@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-15 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("settings_model", "0001_initial")]
+
+    operations = [
+        migrations.AlterField(
+            model_name="settings",
+            name="is_active",
+            field=models.BooleanField(db_index=True, default=True),
+        )
+    ]
@@ -1,8 +1,8 @@
 import logging
+import secrets
 
 from django.db import models
 from django.db.utils import Error as DBError
-from django.utils.crypto import get_random_string
 from django.utils.translation import gettext_lazy as _
 
 from .base import SettingsModel
@@ -37,6 +37,9 @@ class Settings(SettingsModel):
         ("allowed_hosts", "ALLOWED_HOSTS", True, True),
     ]
 
+    # fields which need special encoding; the rest are encoded with `repr`
+    _ENCODERS = {"allowed_hosts": str}
+
     class Meta:
         verbose_name = verbose_name_plural = "Settings"
 
@@ -50,14 +53,14 @@ class Settings(SettingsModel):
         try:
             s = cls.objects.filter(is_active=True).first()
             if s and s.secret_key == "not-a-very-good-secret":
-                chars = "abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)"
-                s.secret_key = get_random_string(50, chars)
-                s.save()
+                s.secret_key = secrets.token_urlsafe(50)[:50]
+
+                # only the key changed, so skip the full save and just write the file
+                cls.objects.filter(pk=s.pk).update(secret_key=s.secret_key)
+                s._schedule_write_and_signal_reboot()
         except DBError:
             logger.warning("db not ready (error on {} model)".format(cls.__name__))
             return
 
-    def encode_setting(self, field):
-        if field is self.allowed_hosts:
-            return str(field)
-        return field.__repr__()
+    def encode_setting(self, field, value):
+        return self._ENCODERS.get(field, repr)(value)
@@ -10,13 +10,14 @@ from django.conf import settings
 import os
 import sys
 
+_me = sys.modules[__name__]
+
 
 def get_setting(name):
     """
     Hook for getting Django settings and using properties of this file as the default.
     """
-    me = sys.modules[__name__]
-    return getattr(settings, name, getattr(me, name, None))
+    return getattr(settings, name, getattr(_me, name, None))
 
 
 # app-specific settings
@@ -2,8 +2,13 @@
 Unit tests
 """
 
+import os
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.test import Client, TestCase
+from django.test.utils import isolate_apps
 from django.urls import reverse
 
 from . import wsgi
@@ -35,9 +40,94 @@ class SettingsModelTestCase(TestCase):
         self.settings.save()
         self.assertEqual(self.settings.debug_mode, not old_debug)
 
+    def test_only_one_active(self):
+        other = Settings.objects.create(name="Other", is_active=False)
+        other.is_active = True
+        other.save(reboot=False)
+        self.assertEqual(Settings.objects.get(is_active=True), other)
+
+        # extraneous active settings are deactivated when saving inactive settings
+        Settings.objects.update(is_active=True)
+        other.is_active = False
+        other.save(reboot=False)
+        self.assertEqual(Settings.objects.filter(is_active=True).count(), 1)
+
+    def test_read_settings_unchanged(self):
+        with self.assertNumQueries(0):
+            self.settings.read_settings()
+
+    def test_encode_setting(self):
+        value = "['*']"
+        self.assertEqual(self.settings.encode_setting("allowed_hosts", value), value)
+        self.assertEqual(self.settings.encode_setting("secret_key", value), repr(value))
+
+    def test_single_write_per_transaction(self):
+        # use a savepoint, so the callback isn't merged with the one from `setUp`
+        with mock.patch.object(
+            Settings, "write_settings", autospec=True, return_value=True
+        ) as write_settings, mock.patch.object(Settings, "signal_reboot"):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    self.settings.secret_key = "first-key"
+                    self.settings.save()
+                    self.settings.secret_key = "second-key"
+                    self.settings.save()
+        self.assertEqual(len(callbacks), 1)
+        write_settings.assert_called_once_with(self.settings)
+
+    def test_write_ignores_rolled_back_savepoint(self):
+        # use a savepoint, so the callback isn't merged with the one from `setUp`
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.settings.secret_key = "committed-key"
+                self.settings.save()
+                with transaction.atomic():
+                    copy = Settings.objects.get(pk=self.settings.pk)
+                    copy.secret_key = "rolled-back-key"
+                    copy.save()
+                    transaction.set_rollback(True)
+        with open(self.settings._get_settings_file()) as f:
+            self.assertIn("'committed-key'", f.read())
+
+    def test_check_secret_key(self):
+        Settings.objects.update(secret_key="not-a-very-good-secret")
+        # use a savepoint, so the callback isn't merged with the one from `setUp`
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Settings.check_secret_key()
+        self.settings.refresh_from_db()
+        self.assertNotEqual(self.settings.secret_key, "not-a-very-good-secret")
+        self.assertEqual(len(self.settings.secret_key), 50)
+        with open(self.settings._get_settings_file()) as f:
+            self.assertIn(repr(self.settings.secret_key), f.read())
+
+    @isolate_apps("settings_model")
+    def test_legacy_encode_setting(self):
+        class LegacySettings(Settings):
+            def encode_setting(self, field):
+                return repr(field)
+
+            class Meta:
+                proxy = True
+
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(LegacySettings()._encode_setting("secret_key", "x"), "'x'")
+
     def test_write_and_reboot(self):
         self.settings.write_and_signal_reboot()
 
+    def test_write_failure_cleans_up(self):
+        self.settings.secret_key = "unwritten-key"
+        directory = os.path.dirname(self.settings._get_settings_file())
+        with mock.patch("os.fsync", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.settings.write_settings()
+        self.assertFalse([f for f in os.listdir(directory) if f.endswith(".tmp")])
+
+    def test_write_unchanged(self):
+        self.settings.write_settings()
+        self.assertFalse(self.settings.write_settings())
+
 
 class SettingsModelAdminTestCase(TestCase):
     """
@@ -63,6 +153,16 @@ class SettingsModelAdminTestCase(TestCase):
         response = self.client.get(reverse("admin:settings_model_settings_add"))
         self.assertEqual(response.status_code, 200)
 
+    def test_add_active(self):
+        Settings.init()
+        self.assertTrue(self.login)
+        response = self.client.post(
+            reverse("admin:settings_model_settings_add"),
+            {"name": "Other", "is_active": "on", "secret_key": "x"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Settings.objects.get(is_active=True).name, "Other")
+
 
 class WSGITestCase(TestCase):
     """